@@ -0,0 +1,128 @@
+"""
+Modo de armazenamento em buckets (MESSAGE_LAYOUT=bucket): um documento por
+sala a cada BUCKET_SIZE mensagens, acrescentadas com `$push`.
+
+Formato de um bucket na coleção `message_buckets`:
+
+    {room, open, start_id, end_id, count, messages: [{_id, username, content, created_at}]}
+
+`start_id`/`end_id` são o menor e o maior `_id` das mensagens do bucket, o
+que mantém os cursores por `_id` (before_id, after_id, since) funcionando.
+`open` marca o bucket que recebe as mensagens novas da sala; com o índice
+`{room, open}` cada gravação encontra esse bucket sem varrer os antigos.
+"""
+
+import heapq
+from app.config import BUCKET_SIZE, EXPORT_BATCH_SIZE
+from app.database import db, raw_collection
+from app.metrics import MONGO_SECONDS
+from app.models import item_json
+
+BUCKETS = "message_buckets"
+
+async def append_many(docs: list, size: int = BUCKET_SIZE):
+    """
+    Acrescenta mensagens ao bucket aberto de cada sala, abrindo um novo
+    bucket (e fechando o anterior) quando o atual não comporta o lote.
+    """
+    by_room = {}
+    for doc in docs:
+        by_room.setdefault(doc["room"], []).append({k: v for k, v in doc.items() if k != "room"})
+    coll = db()[BUCKETS]
+    for room, msgs in by_room.items():
+        for i in range(0, len(msgs), size):
+            chunk = msgs[i:i + size]
+            ids = [m["_id"] for m in chunk]
+            result = await coll.update_one(
+                {"room": room, "open": True, "count": {"$lte": size - len(chunk)}},
+                {
+                    "$push": {"messages": {"$each": chunk}},
+                    "$inc": {"count": len(chunk)},
+                    "$min": {"start_id": min(ids)},
+                    "$max": {"end_id": max(ids)},
+                },
+                upsert=True,
+            )
+            if result.upserted_id is not None:
+                await coll.update_many(
+                    {"room": room, "open": True, "_id": {"$ne": result.upserted_id}},
+                    {"$set": {"open": False}},
+                )
+
+async def insert_backfill(room: str, docs: list):
+    """
+    Grava mensagens antigas (já ordenadas por `_id`) em um bucket próprio,
+    fechado e marcado com `migrated`, sem tocar no bucket aberto da sala.
+    """
+    msgs = [{k: v for k, v in doc.items() if k != "room"} for doc in docs]
+    await db()[BUCKETS].insert_one({
+        "room": room,
+        "open": False,
+        "migrated": True,
+        "start_id": msgs[0]["_id"],
+        "end_id": msgs[-1]["_id"],
+        "count": len(msgs),
+        "messages": msgs,
+    })
+
+def _in_range(msg_id, id_range: dict) -> bool:
+    for op, bound in id_range.items():
+        if op == "$lt" and not msg_id < bound:
+            return False
+        if op == "$gt" and not msg_id > bound:
+            return False
+        if op == "$gte" and not msg_id >= bound:
+            return False
+    return True
+
+async def load_page(room: str, limit: int, before_id=None) -> list:
+    """
+    Últimas `limit` mensagens da sala (anteriores a `before_id`, se dado), da
+    mais antiga para a mais recente, como pares (id, json). Os buckets são
+    lidos do mais recente para o mais antigo até que nenhum outro possa ter
+    mensagens mais novas que as já encontradas. Na primeira página só as
+    últimas `limit` mensagens de cada bucket são transferidas (`$slice`).
+    """
+    query = {"room": room}
+    id_range = {}
+    if before_id is not None:
+        id_range["$lt"] = before_id
+        query["start_id"] = {"$lt": before_id}
+        projection = {"messages": 1, "end_id": 1}
+    else:
+        # os `$push` seguem a ordem de gravação, então o fim do array tem as mais novas
+        projection = {"messages": {"$slice": -limit}, "end_id": 1}
+    cursor = raw_collection(BUCKETS).find(query, projection).sort("end_id", -1)
+    found = []
+    with MONGO_SECONDS.time("history"):
+        async for bucket in cursor:
+            if len(found) >= limit and bucket["end_id"] < found[limit - 1][0]:
+                break
+            found += [(m["_id"], m) for m in bucket["messages"] if _in_range(m["_id"], id_range)]
+            found.sort(key=lambda t: t[0], reverse=True)
+            del found[limit:]
+    found.reverse()
+    return [(str(msg_id), item_json(m, room)) for msg_id, m in found]
+
+async def export(room: str, id_range: dict):
+    """
+    Gera os pares (id, json) das mensagens da sala dentro de `id_range`, em
+    ordem de `_id`. Buckets com faixas sobrepostas são intercalados por um heap.
+    """
+    query = {"room": room}
+    lower = {op: v for op, v in id_range.items() if op in ("$gt", "$gte")}
+    if lower:
+        query["end_id"] = lower
+    cursor = raw_collection(BUCKETS).find(query, {"messages": 1, "start_id": 1}).sort("start_id", 1)
+    heap = []
+    async for bucket in cursor.batch_size(max(1, EXPORT_BATCH_SIZE // BUCKET_SIZE)):
+        start = bucket["start_id"]
+        while heap and heap[0][0] < start:
+            msg_id, m = heapq.heappop(heap)
+            yield str(msg_id), item_json(m, room)
+        for m in bucket["messages"]:
+            if _in_range(m["_id"], id_range):
+                heapq.heappush(heap, (m["_id"], m))
+    while heap:
+        msg_id, m = heapq.heappop(heap)
+        yield str(msg_id), item_json(m, room)
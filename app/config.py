@@ -11,5 +11,51 @@ load_dotenv(dotenv_path=ROOT / ".env")
 
 MONGO_URL = os.getenv("MONGO_URL", "")
 MONGO_DB = os.getenv("MONGO_DB", "chatdb")
+# "mongo" (padrão) ou "memory" (sem persistência; para testes locais e benchmark)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+# Layout das mensagens: "flat" (um documento por mensagem) ou "bucket" (um
+# documento por sala a cada BUCKET_SIZE mensagens; exige MongoDB).
+MESSAGE_LAYOUT = os.getenv("MESSAGE_LAYOUT", "flat")
+BUCKET_SIZE = int(os.getenv("BUCKET_SIZE", "200"))
 APP_HOST = os.getenv("APP_HOST", "0.0.0.0")
-APP_PORT = int(os.getenv("APP_PORT", "8000"))
\ No newline at end of file
+APP_PORT = int(os.getenv("APP_PORT", "8000"))
+
+# Fan-out do WebSocket: tamanho da fila de saída por conexão e política
+# aplicada quando um cliente lento enche a fila ("drop_oldest", "coalesce"
+# ou "disconnect").
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "256"))
+WS_SLOW_POLICY = os.getenv("WS_SLOW_POLICY", "drop_oldest")
+# Com "coalesce", tamanho máximo (bytes) do frame agrupado; acima dele o
+# cliente é desconectado.
+WS_COALESCE_MAX_BYTES = int(os.getenv("WS_COALESCE_MAX_BYTES", str(1024 * 1024)))
+
+# Pub/sub entre processos: "memory" (apenas este processo) ou "mongo"
+# (change streams da coleção messages; exige replica set, como no Atlas).
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")
+
+# Gravação em lote: "ack" transmite após a confirmação do MongoDB; "async"
+# transmite na hora e persiste em segundo plano.
+INGEST_MODE = os.getenv("INGEST_MODE", "ack")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "100"))
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", "5"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "10000"))
+
+# Cache do histórico recente: mensagens por sala, número de salas e teto
+# aproximado de memória (bytes).
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "50"))
+HISTORY_CACHE_ROOMS = int(os.getenv("HISTORY_CACHE_ROOMS", "1000"))
+HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Validade (ms) de cada sala em cache com PUBSUB_BACKEND=memory, que não vê
+# as escritas de outros workers; 0 desliga (um único processo).
+HISTORY_CACHE_TTL_MS = int(os.getenv("HISTORY_CACHE_TTL_MS", "1000"))
+
+# Retomada de sessão WebSocket (?last_seen_id=): mensagens por frame de
+# catch-up e máximo enviado por conexão (o cliente reconecta para o resto).
+RESUME_CHUNK_SIZE = int(os.getenv("RESUME_CHUNK_SIZE", "200"))
+RESUME_MAX_MESSAGES = int(os.getenv("RESUME_MAX_MESSAGES", "5000"))
+
+# Exportação NDJSON: documentos por lote do cursor no servidor.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Habilita as rotas /debug/profiler/* (profiler por amostragem sob demanda).
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "").lower() in ("1", "true", "yes")
@@ -2,18 +2,62 @@
 Conexão com MongoDB e funções auxiliares.
 """
 
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
 from motor.motor_asyncio import AsyncIOMotorClient
-from .config import MONGO_URL, MONGO_DB
+from .config import MONGO_URL, MONGO_DB, STORAGE_BACKEND, MESSAGE_LAYOUT
+from .memory_store import MemoryClient
+
+# Índices dos quais dependem as consultas de histórico e exportação.
+MESSAGE_INDEXES = [
+    ([("room", 1), ("_id", -1)], "room_1__id_-1"),
+]
+BUCKET_INDEXES = [
+    ([("room", 1), ("open", 1)], "room_1_open_1"),
+    ([("room", 1), ("end_id", -1)], "room_1_end_id_-1"),
+    ([("room", 1), ("start_id", 1)], "room_1_start_id_1"),
+]
+
+_RAW = CodecOptions(document_class=RawBSONDocument)
 
 _client = None
 
 def db():
     """
-    Retorna a instância do banco de dados MongoDB.
+    Retorna a instância do banco de dados MongoDB (ou o armazenamento em
+    memória, com STORAGE_BACKEND=memory).
     """
     global _client
     if _client is None:
+        if STORAGE_BACKEND == "memory":
+            _client = MemoryClient()
+            return _client[MONGO_DB]
         if not MONGO_URL:
             raise RuntimeError("Defina MONGO_URL no .env (string do MongoDB Atlas).")
         _client = AsyncIOMotorClient(MONGO_URL)
-    return _client[MONGO_DB]
\ No newline at end of file
+    return _client[MONGO_DB]
+
+def raw_collection(name: str):
+    """
+    Coleção devolvendo RawBSONDocument, para leituras que vão direto para
+    JSON sem passar por dicts Python.
+    """
+    return db()[name].with_options(codec_options=_RAW)
+
+def raw_messages():
+    return raw_collection("messages")
+
+async def ensure_indexes(layout: str = MESSAGE_LAYOUT):
+    """
+    Cria (se preciso) e verifica os índices da coleção usada pelo layout.
+    """
+    if layout == "bucket" and STORAGE_BACKEND == "memory":
+        raise RuntimeError("MESSAGE_LAYOUT=bucket exige MongoDB; use MESSAGE_LAYOUT=flat com STORAGE_BACKEND=memory.")
+    name, indexes = ("message_buckets", BUCKET_INDEXES) if layout == "bucket" else ("messages", MESSAGE_INDEXES)
+    coll = db()[name]
+    for keys, index in indexes:
+        await coll.create_index(keys, name=index)
+    info = await coll.index_information()
+    for keys, index in indexes:
+        if index not in info or [tuple(k) for k in info[index]["key"]] != keys:
+            raise RuntimeError(f"Índice {index} ausente ou diferente em {name}.")
\ No newline at end of file
@@ -0,0 +1,205 @@
+"""
+Cache em memória do histórico recente de cada sala.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from app.config import (
+    HISTORY_CACHE_SIZE, HISTORY_CACHE_ROOMS, HISTORY_CACHE_MAX_BYTES, HISTORY_CACHE_TTL_MS, MESSAGE_LAYOUT,
+    PUBSUB_BACKEND,
+)
+from app.database import raw_messages
+from app import buckets
+from app.models import ITEM_FIELDS, item_json
+from app.metrics import MONGO_SECONDS, HISTORY_CACHE
+
+async def load_page(room: str, limit: int, before_id=None) -> list:
+    """
+    Busca as últimas `limit` mensagens da sala (anteriores a `before_id`, se
+    dado), da mais antiga para a mais recente, como pares (id, json) já
+    codificados.
+    """
+    if MESSAGE_LAYOUT == "bucket":
+        return await buckets.load_page(room, limit, before_id)
+    query = {"room": room}
+    if before_id is not None:
+        query["_id"] = {"$lt": before_id}
+    cursor = raw_messages().find(query, ITEM_FIELDS).sort("_id", -1).limit(limit)
+    with MONGO_SECONDS.time("history"):
+        items = [(str(d["_id"]), item_json(d)) async for d in cursor]
+    items.reverse()
+    return items
+
+async def load_recent(room: str, limit: int) -> list:
+    return await load_page(room, limit)
+
+async def iter_range(room: str, id_range: dict, batch_size: int):
+    """
+    Percorre em ordem de `_id` as mensagens da sala dentro de `id_range`
+    ($gt/$gte), como pares (id, json), com memória constante.
+    """
+    if MESSAGE_LAYOUT == "bucket":
+        async for pair in buckets.export(room, id_range):
+            yield pair
+        return
+    query = {"room": room}
+    if id_range:
+        query["_id"] = id_range
+    cursor = raw_messages().find(query, ITEM_FIELDS).sort("_id", 1).batch_size(batch_size)
+    async for d in cursor:
+        yield str(d["_id"]), item_json(d)
+
+def _size(item: tuple) -> int:
+    return 64 + len(item[1])
+
+class _Ring:
+    def __init__(self, items: list, complete: bool):
+        self.items = deque(items)
+        self.bytes = sum(_size(i) for i in items)
+        # True quando a sala tem menos mensagens do que o anel comporta
+        self.complete = complete
+        self.loaded_at = time.monotonic()
+
+class HistoryCache:
+    """
+    Mantém as últimas `size` mensagens, já codificadas em JSON como pares
+    (id, json), das salas mais acessadas,
+    com despejo LRU por número de salas e por um teto aproximado de memória.
+    Falhas simultâneas para a mesma sala compartilham uma única consulta.
+    Com `ttl` (segundos) o anel é recarregado do banco depois desse tempo.
+    """
+    def __init__(self, loader, size: int = HISTORY_CACHE_SIZE, max_rooms: int = HISTORY_CACHE_ROOMS,
+                 max_bytes: int = HISTORY_CACHE_MAX_BYTES, ttl: float = 0):
+        self.loader = loader
+        self.size = size
+        self.max_rooms = max_rooms
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.rooms = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._inflight = {}
+        self._pending = {}
+        # salas despejadas durante uma carga em andamento: o resultado pode
+        # ter perdido escritas e não deve ir para o cache
+        self._stale = set()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "rooms": len(self.rooms),
+            "bytes": self.bytes,
+        }
+
+    def collect_metrics(self):
+        for stat, value in self.stats().items():
+            HISTORY_CACHE.set(value, stat)
+
+    async def recent(self, room: str, limit: int, cache: bool = True) -> list:
+        """
+        Retorna as últimas `limit` mensagens da sala. Com `cache=False` o anel
+        da sala não é lido nem guardado, mas a consulta continua sendo
+        compartilhada entre chamadas simultâneas.
+        """
+        if limit > self.size:
+            return await self.loader(room, limit)
+        ring = self._ring(room) if cache else None
+        if ring is not None and (ring.complete or len(ring.items) >= limit):
+            self.hits += 1
+            self.rooms.move_to_end(room)
+            return list(ring.items)[-limit:]
+        self.misses += 1
+        fut = self._inflight.get(room)
+        if fut is None:
+            # registrado já aqui para que um despejo antes da task rodar conte
+            self._pending[room] = []
+            self._stale.discard(room)
+            fut = asyncio.ensure_future(self._load(room, cache))
+            self._inflight[room] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(room, None))
+        items = await asyncio.shield(fut)
+        return items[-limit:]
+
+    def after(self, room: str, msg_id: str):
+        """
+        Mensagens em cache posteriores a `msg_id`, ou None se o anel da sala
+        não contém essa mensagem (o intervalo precisa vir do banco).
+        """
+        ring = self._ring(room)
+        if ring is not None:
+            items = list(ring.items)
+            for i, item in enumerate(items):
+                if item[0] == msg_id:
+                    self.hits += 1
+                    self.rooms.move_to_end(room)
+                    return items[i + 1:]
+        self.misses += 1
+        return None
+
+    def _ring(self, room: str):
+        ring = self.rooms.get(room)
+        if ring is not None and self.ttl and time.monotonic() - ring.loaded_at > self.ttl:
+            self.evict(room)
+            return None
+        return ring
+
+    async def _load(self, room: str, cache: bool) -> list:
+        try:
+            items = await self.loader(room, self.size)
+            complete = len(items) < self.size
+            seen = {i[0] for i in items}
+            items += [i for i in self._pending[room] if i[0] not in seen]
+        finally:
+            self._pending.pop(room, None)
+        items = items[-self.size:]
+        if room in self._stale:
+            self._stale.discard(room)
+        elif cache:
+            self._store(room, _Ring(items, complete))
+        return items
+
+    def _store(self, room: str, ring: _Ring):
+        self.evict(room)
+        self.rooms[room] = ring
+        self.bytes += ring.bytes
+        self._shrink()
+
+    def _shrink(self):
+        while len(self.rooms) > self.max_rooms or (self.bytes > self.max_bytes and len(self.rooms) > 1):
+            _, ring = self.rooms.popitem(last=False)
+            self.bytes -= ring.bytes
+
+    def evict(self, room: str):
+        if room in self._pending:
+            self._stale.add(room)
+        ring = self.rooms.pop(room, None)
+        if ring is not None:
+            self.bytes -= ring.bytes
+
+    def append(self, room: str, msg_id: str, text: str):
+        """
+        Acrescenta uma mensagem nova ao anel da sala, se ela estiver em cache.
+        """
+        item = (msg_id, text)
+        pending = self._pending.get(room)
+        if pending is not None:
+            pending.append(item)
+        ring = self.rooms.get(room)
+        if ring is None or any(i[0] == msg_id for i in ring.items):
+            return
+        ring.items.append(item)
+        size = _size(item)
+        ring.bytes += size
+        self.bytes += size
+        if len(ring.items) > self.size:
+            size = _size(ring.items.popleft())
+            ring.bytes -= size
+            self.bytes -= size
+            ring.complete = False
+        self._shrink()
+
+# o barramento em memória não vê as escritas de outros workers
+history = HistoryCache(load_recent, ttl=HISTORY_CACHE_TTL_MS / 1000 if PUBSUB_BACKEND == "memory" else 0)
@@ -0,0 +1,130 @@
+"""
+Pipeline de escrita em lote (write-behind) para as mensagens do chat.
+"""
+
+import asyncio
+import logging
+from bson import ObjectId
+from app.database import db
+from app.buckets import append_many
+from app.config import INGEST_MODE, INGEST_BATCH_SIZE, INGEST_FLUSH_MS, INGEST_MAX_PENDING, MESSAGE_LAYOUT
+from app.metrics import MONGO_SECONDS, INGEST_PENDING
+
+log = logging.getLogger(__name__)
+
+INGEST_MODES = ("ack", "async")
+
+class InsertBatcher:
+    """
+    Agrupa os documentos pendentes em lotes gravados por `write_many`
+    (`insert_many` ou `$push` em buckets), disparados quando o lote enche ou
+    quando a janela de `flush_ms` termina.
+
+    - mode="ack": `submit` só retorna depois da confirmação do MongoDB.
+    - mode="async": `submit` retorna logo e a persistência segue em segundo plano.
+
+    A fila é limitada a `max_pending` documentos; quando cheia, `submit`
+    aguarda (backpressure) em vez de acumular memória.
+    """
+    def __init__(self, write_many, op: str = "insert_many", mode: str = INGEST_MODE, batch_size: int = INGEST_BATCH_SIZE,
+                 flush_ms: int = INGEST_FLUSH_MS, max_pending: int = INGEST_MAX_PENDING):
+        if mode not in INGEST_MODES:
+            raise ValueError(f"INGEST_MODE inválido: {mode!r} (use {', '.join(INGEST_MODES)})")
+        self.write_many = write_many
+        self.op = op
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.max_pending = max_pending
+        self._queue = None
+        self._full = None
+        self._task = None
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._full = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Grava tudo o que ainda estiver pendente e encerra o pipeline.
+        """
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        self._full.set()
+        await self._task
+        self._task = None
+
+    def collect_metrics(self):
+        INGEST_PENDING.set(self._queue.qsize() if self._queue is not None else 0)
+
+    async def submit(self, doc: dict) -> dict:
+        """
+        Enfileira o documento para gravação. O `_id` é gerado aqui, para que
+        a mensagem possa ser transmitida antes de chegar ao banco.
+        """
+        doc.setdefault("_id", ObjectId())
+        if self._task is None:
+            with MONGO_SECONDS.time(self.op):
+                await self.write_many([doc])
+            return doc
+        fut = asyncio.get_running_loop().create_future() if self.mode == "ack" else None
+        await self._queue.put((doc, fut))
+        if self._queue.qsize() >= self.batch_size:
+            self._full.set()
+        if fut is not None:
+            await fut
+        return doc
+
+    async def _run(self):
+        closing = False
+        while not closing:
+            first = await self._queue.get()
+            if first is None:
+                break
+            if self._queue.qsize() + 1 < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+            self._full.clear()
+            batch = [first]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        # itens que chegaram depois do sinal de encerramento
+        rest = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                rest.append(item)
+        for i in range(0, len(rest), self.batch_size):
+            await self._flush(rest[i:i + self.batch_size])
+
+    async def _flush(self, batch: list):
+        try:
+            with MONGO_SECONDS.time(self.op):
+                await self.write_many([doc for doc, _ in batch])
+        except Exception as exc:
+            if self.mode == "async":
+                log.exception("falha ao gravar lote de %d mensagens", len(batch))
+            for _, fut in batch:
+                if fut is not None and not fut.done():
+                    fut.set_exception(exc)
+            return
+        for _, fut in batch:
+            if fut is not None and not fut.done():
+                fut.set_result(None)
+
+async def insert_flat(docs: list):
+    await db()["messages"].insert_many(docs, ordered=True)
+
+if MESSAGE_LAYOUT == "bucket":
+    ingest = InsertBatcher(append_many, op="bucket_push")
+else:
+    ingest = InsertBatcher(insert_flat)
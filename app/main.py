@@ -2,17 +2,34 @@
 Inicialização do FastAPI, montagem das rotas e WebSocket.
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from contextlib import asynccontextmanager
+from typing import Optional
+from bson import ObjectId
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.config import APP_HOST, APP_PORT
-from app.ws_manager import WSManager
-from app.models import serialize
-from app.database import db
-from app.routes import messages
+from app.config import APP_HOST, APP_PORT, RESUME_CHUNK_SIZE, RESUME_MAX_MESSAGES
+from app.ws_manager import manager
+from app.models import serialize, new_message, items_json
+from app.database import ensure_indexes
+from app.history import history, iter_range
+from app.ingest import ingest
+from app.metrics import registry
+from app.routes import messages, metrics
 
-app = FastAPI(title="FastAPI Chat + MongoDB Atlas (Refatorado)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    await ingest.start()
+    await manager.start()
+    registry.start(manager.collect_metrics, history.collect_metrics, ingest.collect_metrics)
+    yield
+    registry.stop()
+    await manager.stop()
+    await ingest.stop()
+
+app = FastAPI(title="FastAPI Chat + MongoDB Atlas (Refatorado)", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True,
@@ -22,21 +39,59 @@ app.add_middleware(
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 app.include_router(messages.router)
+app.include_router(metrics.router)
 
 @app.get("/", include_in_schema=False)
 async def index():
     return FileResponse("app/static/index.html")
 
-manager = WSManager()
+async def _cached(items: list):
+    for item in items:
+        yield item
+
+def _delta_frame(items: list, more: bool, truncated: bool = False) -> str:
+    flags = f'"delta":true,"more":{str(more).lower()},"truncated":{str(truncated).lower()}'
+    return '{"type":"history",' + flags + ',"items":' + items_json(items) + "}"
+
+async def send_history(room: str, ws: WebSocket, last_seen_id: Optional[str]):
+    """
+    Sem `last_seen_id`, envia as últimas 20 mensagens. Com ele, envia só as
+    mensagens posteriores (do cache ou do banco), em frames de até
+    RESUME_CHUNK_SIZE itens marcados com `delta`; `more` indica que há
+    outro frame a caminho e `truncated` que o limite por conexão foi atingido.
+    """
+    if not last_seen_id or not ObjectId.is_valid(last_seen_id):
+        items = await history.recent(room, 20, cache=manager.tracks(room))
+        await manager.send_frame(room, ws, '{"type":"history","items":' + items_json(items) + "}")
+        return
+    cached = history.after(room, last_seen_id) if manager.tracks(room) else None
+    source = _cached(cached) if cached is not None else \
+        iter_range(room, {"$gt": ObjectId(last_seen_id)}, RESUME_CHUNK_SIZE)
+    chunk = []
+    sent = 0
+    truncated = False
+    async for item in source:
+        if len(chunk) == RESUME_CHUNK_SIZE:
+            sent += len(chunk)
+            if not await manager.send_frame(room, ws, _delta_frame(chunk, more=True)):
+                return
+            chunk = []
+        if sent + len(chunk) >= RESUME_MAX_MESSAGES:
+            truncated = True
+            break
+        chunk.append(item)
+    await manager.send_frame(room, ws, _delta_frame(chunk, more=False, truncated=truncated))
 
 @app.websocket("/ws/{room}")
-async def ws_room(ws: WebSocket, room: str):
-    await manager.connect(room, ws)
+async def ws_room(
+    ws: WebSocket,
+    room: str,
+    last_seen_id: Optional[str] = Query(None),
+    batch_ms: int = Query(0, ge=0, le=1000),
+):
+    await manager.connect(room, ws, batch_ms=batch_ms)
     try:
-        cursor = db()["messages"].find({"room": room}).sort("_id", -1).limit(20)
-        items = [serialize(d) async for d in cursor]
-        items.reverse()
-        await ws.send_json({"type": "history", "items": items})
+        await send_history(room, ws, last_seen_id)
 
         while True:
             payload = await ws.receive_json()
@@ -44,16 +99,11 @@ async def ws_room(ws: WebSocket, room: str):
             content = str(payload.get("content", "")).strip()
             if not content:
                 continue
-            doc = {
-                "room": room,
-                "username": username,
-                "content": content,
-                "created_at": __import__("datetime").datetime.now(__import__("datetime").timezone.utc),
-            }
-            res = await db()["messages"].insert_one(doc)
-            doc["_id"] = res.inserted_id
-            await manager.broadcast(room, {"type": "message", "item": serialize(doc)})
+            doc = await ingest.submit(new_message(room, username, content))
+            await manager.publish(room, {"type": "message", "item": serialize(doc)})
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(room, ws)
 
 if __name__ == "__main__":
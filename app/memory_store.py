@@ -0,0 +1,147 @@
+"""
+Armazenamento em memória com o subconjunto da API do Motor usado pelo app.
+Serve para desenvolvimento local e para o benchmark, sem MongoDB Atlas.
+"""
+
+import bisect
+from bson import ObjectId
+
+def _id_key(doc: dict):
+    return doc["_id"]
+
+def _id_range(items: list, cond) -> tuple:
+    """
+    Converte o filtro de `_id` ($lt, $lte, $gt, $gte ou igualdade) em uma
+    faixa de posições da lista ordenada.
+    """
+    lo, hi = 0, len(items)
+    if cond is None:
+        return lo, hi
+    if not isinstance(cond, dict):
+        cond = {"$gte": cond, "$lte": cond}
+    for op, value in cond.items():
+        if op == "$gt":
+            lo = max(lo, bisect.bisect_right(items, value, key=_id_key))
+        elif op == "$gte":
+            lo = max(lo, bisect.bisect_left(items, value, key=_id_key))
+        elif op == "$lt":
+            hi = min(hi, bisect.bisect_left(items, value, key=_id_key))
+        elif op == "$lte":
+            hi = min(hi, bisect.bisect_right(items, value, key=_id_key))
+        else:
+            raise NotImplementedError(f"Operador {op} não suportado pelo armazenamento em memória.")
+    return lo, max(lo, hi)
+
+class MemoryCursor:
+    """
+    Cursor assíncrono sobre os documentos de uma sala; a faixa só é
+    calculada quando a iteração começa, como no Motor.
+    """
+    def __init__(self, collection, query: dict, projection=None):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self._direction = 1
+        self._limit = 0
+        self._iter = None
+
+    def sort(self, key, direction=1):
+        if key != "_id":
+            raise NotImplementedError("O armazenamento em memória só ordena por _id.")
+        self._direction = direction
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _docs(self):
+        extra = set(self.query) - {"room", "_id"}
+        if "room" not in self.query or extra:
+            raise NotImplementedError("O armazenamento em memória só consulta por room e _id.")
+        items = self.collection.rooms.get(self.query["room"], [])
+        lo, hi = _id_range(items, self.query.get("_id"))
+        if self._direction < 0:
+            start = max(lo, hi - self._limit) if self._limit else lo
+            docs = items[start:hi][::-1]
+        else:
+            end = min(hi, lo + self._limit) if self._limit else hi
+            docs = items[lo:end]
+        if self.projection:
+            keep = {k for k, v in self.projection.items() if v} | {"_id"}
+            return [{k: v for k, v in d.items() if k in keep} for d in docs]
+        return [dict(d) for d in docs]
+
+    def __aiter__(self):
+        self._iter = iter(self._docs())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class _InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+class _InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+class MemoryCollection:
+    """
+    Coleção em memória: documentos por sala, ordenados por `_id`.
+    """
+    def __init__(self):
+        self.rooms = {}
+        self.indexes = {"_id_": {"key": [("_id", 1)]}}
+
+    def with_options(self, **kwargs):
+        return self
+
+    def _add(self, doc: dict):
+        doc.setdefault("_id", ObjectId())
+        items = self.rooms.setdefault(doc["room"], [])
+        if not items or items[-1]["_id"] < doc["_id"]:
+            items.append(dict(doc))
+        else:
+            bisect.insort(items, dict(doc), key=_id_key)
+        return doc["_id"]
+
+    async def insert_one(self, doc: dict):
+        return _InsertOneResult(self._add(doc))
+
+    async def insert_many(self, docs: list, ordered: bool = True):
+        return _InsertManyResult([self._add(d) for d in docs])
+
+    def find(self, query: dict, projection=None):
+        return MemoryCursor(self, query, projection)
+
+    async def create_index(self, keys, name: str):
+        self.indexes[name] = {"key": list(keys)}
+        return name
+
+    async def index_information(self):
+        return dict(self.indexes)
+
+    def watch(self, *args, **kwargs):
+        raise NotImplementedError("Change streams exigem MongoDB; use PUBSUB_BACKEND=memory.")
+
+class MemoryDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        return self.collections.setdefault(name, MemoryCollection())
+
+class MemoryClient:
+    def __init__(self):
+        self.databases = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        return self.databases.setdefault(name, MemoryDatabase())
@@ -0,0 +1,143 @@
+"""
+Métricas do caminho quente (contadores, gauges e histogramas) expostas
+no formato texto do Prometheus, sem dependências externas.
+"""
+
+import bisect
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, _labels(self.labels, labels), value
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def clear(self):
+        self.values.clear()
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, value: float, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            # contagens por bucket (não cumulativas) + soma + total
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        for labels, (counts, total, count) in self.values.items():
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                acc += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield self.name + "_bucket", _labels(self.labels + ("le",), labels + (le,)), acc
+            yield self.name + "_sum", _labels(self.labels, labels), total
+            yield self.name + "_count", _labels(self.labels, labels), count
+
+class Registry:
+    """
+    Registro das métricas do processo. Coletores registrados em `start`
+    (pelo lifespan do app) atualizam gauges no momento da leitura.
+    """
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def start(self, *collectors):
+        self.collectors = list(collectors)
+
+    def stop(self):
+        self.collectors = []
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+MONGO_SECONDS = registry.histogram(
+    "chat_mongo_seconds", "Duração das operações no MongoDB.", ("op",))
+BROADCAST_SECONDS = registry.histogram(
+    "chat_broadcast_seconds", "Tempo de fan-out de um broadcast (codificação + enfileiramento).")
+BROADCAST_RECIPIENTS = registry.counter(
+    "chat_broadcast_recipients_total", "Frames enfileirados por broadcast, somados.")
+WS_SEND_FAILURES = registry.counter(
+    "chat_ws_send_failures_total", "Falhas ao enviar frames para um WebSocket.")
+WS_DISCONNECTS = registry.counter(
+    "chat_ws_disconnects_total", "Desconexões de WebSocket por motivo.", ("reason",))
+WS_DROPPED = registry.counter(
+    "chat_ws_dropped_frames_total", "Frames descartados ou agrupados por fila cheia.", ("policy",))
+ROOM_CONNECTIONS = registry.gauge(
+    "chat_room_connections", "Conexões WebSocket abertas por sala.", ("room",))
+QUEUE_DEPTH = registry.gauge(
+    "chat_ws_queue_depth", "Frames pendentes nas filas de saída da sala (max e sum).", ("room", "stat"))
+HISTORY_CACHE = registry.gauge(
+    "chat_history_cache", "Estado do cache de histórico recente.", ("stat",))
+INGEST_PENDING = registry.gauge(
+    "chat_ingest_pending", "Documentos aguardando gravação em lote.")
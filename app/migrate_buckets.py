@@ -0,0 +1,85 @@
+"""
+Backfill do layout flat (`messages`) para o layout em buckets
+(`message_buckets`).
+
+    python -m app.migrate_buckets [--room SALA] [--batch 1000]
+
+É incremental: o último `_id` copiado de cada sala fica salvo em
+`migrations`, então o comando pode ser interrompido e repetido, inclusive
+com o app já gravando em buckets: cada lote vai para um bucket novo, fechado,
+sem se misturar ao bucket aberto da sala. Mensagens que já estão em algum
+bucket (cópia interrompida antes do checkpoint) não são copiadas de novo. A coleção `messages` não é alterada;
+remova-a manualmente depois de conferir a migração.
+"""
+
+import argparse
+import asyncio
+from app.buckets import insert_backfill
+from app.config import BUCKET_SIZE
+from app.database import db, ensure_indexes
+
+async def _already_copied(room: str, chunk: list) -> set:
+    """
+    `_id`s do lote que já estão nos buckets da sala.
+    """
+    ids = [doc["_id"] for doc in chunk]
+    query = {
+        "room": room,
+        "end_id": {"$gte": ids[0]},
+        "start_id": {"$lte": ids[-1]},
+        "messages._id": {"$in": ids},
+    }
+    found = set()
+    async for bucket in db()["message_buckets"].find(query, {"messages._id": 1}):
+        found.update(m["_id"] for m in bucket["messages"])
+    return found
+
+async def migrate_room(room: str, batch: int = 1000) -> int:
+    """
+    Copia para buckets as mensagens da sala ainda não migradas.
+    """
+    state = db()["migrations"]
+    key = f"buckets:{room}"
+    checkpoint = await state.find_one({"_id": key})
+    query = {"room": room}
+    if checkpoint:
+        query["_id"] = {"$gt": checkpoint["last_id"]}
+    copied = 0
+    chunk = []
+
+    async def flush():
+        nonlocal copied, chunk
+        done = await _already_copied(room, chunk)
+        fresh = [doc for doc in chunk if doc["_id"] not in done]
+        if fresh:
+            await insert_backfill(room, fresh)
+        await state.update_one({"_id": key}, {"$set": {"last_id": chunk[-1]["_id"]}}, upsert=True)
+        copied += len(fresh)
+        chunk = []
+
+    cursor = db()["messages"].find(query).sort("_id", 1).batch_size(batch)
+    async for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) == BUCKET_SIZE:
+            await flush()
+    if chunk:
+        await flush()
+    return copied
+
+async def migrate(rooms: list = None, batch: int = 1000):
+    await ensure_indexes("bucket")
+    if not rooms:
+        rooms = await db()["messages"].distinct("room")
+    for room in rooms:
+        copied = await migrate_room(room, batch)
+        print(f"{room}: {copied} mensagens copiadas")
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra mensagens do layout flat para buckets.")
+    parser.add_argument("--room", action="append", help="migra só esta sala (pode repetir)")
+    parser.add_argument("--batch", type=int, default=1000, help="documentos por lote do cursor")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.room, args.batch))
+
+if __name__ == "__main__":
+    main()
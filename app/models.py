@@ -2,6 +2,7 @@
 Modelos Pydantic e funções de serialização para mensagens.
 """
 
+import json
 from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime, timezone
@@ -18,6 +19,17 @@ class MessageOut(BaseModel):
     content: str
     created_at: datetime
 
+def new_message(room: str, username: str, content: str) -> dict:
+    """
+    Monta o documento de uma nova mensagem para gravação.
+    """
+    return {
+        "room": room,
+        "username": username,
+        "content": content,
+        "created_at": datetime.now(timezone.utc),
+    }
+
 def iso(dt: datetime) -> str:
     """
     Converte datetime para ISO 8601 com timezone.
@@ -34,4 +46,31 @@ def serialize(doc: dict) -> dict:
     d["id"] = str(d.pop("_id"))
     if "created_at" in d and isinstance(d["created_at"], datetime):
         d["created_at"] = iso(d["created_at"])
-    return d
\ No newline at end of file
+    return d
+
+# Campos lidos pelo caminho rápido (projeção das consultas de histórico).
+ITEM_FIELDS = {"room": 1, "username": 1, "content": 1, "created_at": 1}
+
+_quote = json.encoder.encode_basestring
+
+def item_json(doc, room: Optional[str] = None) -> str:
+    """
+    Gera direto o JSON de MessageOut a partir do documento (dict ou
+    RawBSONDocument), lendo só os campos necessários e sem dict intermediário.
+    `room` substitui o campo do documento (mensagens dentro de buckets).
+    """
+    created = doc["created_at"]
+    created = _quote(iso(created)) if isinstance(created, datetime) else json.dumps(created)
+    return (
+        '{"room":' + _quote(doc["room"] if room is None else room)
+        + ',"username":' + _quote(doc["username"])
+        + ',"content":' + _quote(doc["content"])
+        + ',"created_at":' + created
+        + ',"id":"' + str(doc["_id"]) + '"}'
+    )
+
+def items_json(items: list) -> str:
+    """
+    Junta itens já codificados, pares (id, json), em uma lista JSON.
+    """
+    return "[" + ",".join(text for _, text in items) + "]"
\ No newline at end of file
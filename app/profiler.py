@@ -0,0 +1,64 @@
+"""
+Profiler por amostragem que pode ser ligado e desligado em tempo de execução.
+"""
+
+import sys
+import threading
+from collections import Counter
+
+class SamplingProfiler:
+    """
+    Uma thread auxiliar amostra periodicamente a pilha da thread alvo (a do
+    event loop) e acumula as pilhas no formato "collapsed", pronto para
+    gerar flame graphs. Desligado, não tem custo algum.
+    """
+    def __init__(self):
+        self.stacks = Counter()
+        self.samples = 0
+        self.interval = 0.005
+        self._target = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = 5.0):
+        if self.running:
+            return
+        self.stacks.clear()
+        self.samples = 0
+        self.interval = interval_ms / 1000
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        """
+        Desliga o profiler e devolve as pilhas coletadas ("a;b;c N" por linha).
+        """
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+        self._thread = None
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({code.co_filename})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+profiler = SamplingProfiler()
@@ -0,0 +1,198 @@
+"""
+Barramento pub/sub entre o WSManager e os demais processos/nós.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from pymongo.errors import OperationFailure
+from app.config import PUBSUB_BACKEND, MESSAGE_LAYOUT
+from app.models import serialize
+
+log = logging.getLogger(__name__)
+
+# ChangeStreamFatalError, InvalidResumeToken e ChangeStreamHistoryLost: o
+# token não serve mais e o stream precisa recomeçar do momento atual
+_LOST_TOKEN_CODES = (260, 280, 286)
+
+class InProcessBus:
+    """
+    Entrega as publicações apenas aos sockets deste processo.
+    """
+    local_only = True
+
+    def __init__(self):
+        self.rooms = set()
+        self._deliver = None
+
+    async def start(self, deliver):
+        self._deliver = deliver
+
+    async def stop(self):
+        self._deliver = None
+
+    def subscribe(self, room: str):
+        self.rooms.add(room)
+
+    def unsubscribe(self, room: str):
+        self.rooms.discard(room)
+
+    async def publish(self, room: str, payload: dict):
+        if self._deliver and room in self.rooms:
+            await self._deliver(room, payload)
+
+class MongoChangeStreamBus(InProcessBus):
+    """
+    Propaga mensagens entre processos usando change streams da coleção
+    `messages`. Cada processo observa apenas as salas com ouvintes locais;
+    as próprias publicações são entregues localmente na hora e ignoradas
+    quando voltam pelo stream.
+
+    Com `bucketed=True` observa a coleção de buckets: as mensagens novas vêm
+    dos campos `messages.N` de cada `$push` (ou do bucket recém-criado). Os
+    eventos de `$push` não trazem a sala, então a relação bucket -> sala fica
+    em um LRU preenchido pelas inserções e, na falta, por uma consulta ao
+    bucket (só o campo `room`), em vez de `updateLookup` trazer o bucket
+    inteiro a cada mensagem.
+    """
+    local_only = False
+
+    def __init__(self, collection, max_await_ms: int = 200, seen_size: int = 4096, bucketed: bool = False):
+        super().__init__()
+        self.collection = collection
+        self.bucketed = bucketed
+        self.max_await_ms = max_await_ms
+        self.seen_size = seen_size
+        self._seen = OrderedDict()
+        self._bucket_rooms = OrderedDict()
+        self._changed = asyncio.Event()
+        self._task = None
+
+    async def start(self, deliver):
+        await super().start(deliver)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await super().stop()
+
+    def subscribe(self, room: str):
+        if room not in self.rooms:
+            super().subscribe(room)
+            self._changed.set()
+
+    def unsubscribe(self, room: str):
+        if room in self.rooms:
+            super().unsubscribe(room)
+            self._changed.set()
+
+    def _remember(self, msg_id: str):
+        self._seen[msg_id] = None
+        if len(self._seen) > self.seen_size:
+            self._seen.popitem(last=False)
+
+    async def publish(self, room: str, payload: dict):
+        item = payload.get("item") or {}
+        # só salas observadas têm eco; as demais nunca sairiam da lista
+        if "id" in item and room in self.rooms:
+            self._remember(item["id"])
+        await super().publish(room, payload)
+
+    async def _run(self):
+        token = None
+        while True:
+            self._changed.clear()
+            if not self.rooms:
+                # ao voltar a observar, retomar daqui reenviaria como novas as
+                # mensagens gravadas enquanto nenhuma sala era observada
+                token = None
+                await self._changed.wait()
+                continue
+            inserts = {"operationType": "insert", "fullDocument.room": {"$in": sorted(self.rooms)}}
+            if self.bucketed:
+                # buckets do backfill (migrate_buckets) trazem mensagens antigas
+                inserts["fullDocument.migrated"] = {"$ne": True}
+                # a sala de um `$push` só é conhecida aqui, em _documents
+                pipeline = [{"$match": {"$or": [inserts, {"operationType": "update"}]}}]
+            else:
+                pipeline = [{"$match": inserts}]
+            try:
+                async with self.collection().watch(
+                    pipeline, resume_after=token, max_await_time_ms=self.max_await_ms
+                ) as stream:
+                    while not self._changed.is_set():
+                        change = await stream.try_next()
+                        token = stream.resume_token
+                        if change is not None:
+                            for doc in await self._documents(change):
+                                await self._dispatch(doc)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as exc:
+                if exc.code in _LOST_TOKEN_CODES:
+                    token = None
+                log.exception("change stream interrompido; reconectando")
+                await asyncio.sleep(1)
+            except Exception:
+                log.exception("change stream interrompido; reconectando")
+                await asyncio.sleep(1)
+
+    async def _bucket_room(self, bucket_id):
+        room = self._bucket_rooms.get(bucket_id)
+        if room is None:
+            bucket = await self.collection().find_one({"_id": bucket_id}, {"room": 1})
+            if bucket is None:
+                return None
+            room = bucket["room"]
+        self._remember_bucket(bucket_id, room)
+        return room
+
+    def _remember_bucket(self, bucket_id, room: str):
+        self._bucket_rooms[bucket_id] = room
+        self._bucket_rooms.move_to_end(bucket_id)
+        if len(self._bucket_rooms) > self.seen_size:
+            self._bucket_rooms.popitem(last=False)
+
+    async def _documents(self, change: dict) -> list:
+        if not self.bucketed:
+            return [change["fullDocument"]]
+        if change["operationType"] == "insert":
+            bucket = change["fullDocument"]
+            self._remember_bucket(bucket["_id"], bucket["room"])
+            room, msgs = bucket["room"], bucket["messages"]
+        else:
+            room = await self._bucket_room(change["documentKey"]["_id"])
+            if room not in self.rooms:
+                return []
+            fields = change["updateDescription"]["updatedFields"]
+            pushed = [(int(k.split(".")[1]), v) for k, v in fields.items() if k.startswith("messages.")]
+            msgs = [v for _, v in sorted(pushed, key=lambda p: p[0])]
+        return [dict(m, room=room) for m in msgs]
+
+    async def _dispatch(self, doc: dict):
+        msg_id = str(doc["_id"])
+        if msg_id in self._seen:
+            self._seen.pop(msg_id)
+            return
+        room = doc["room"]
+        if self._deliver and room in self.rooms:
+            await self._deliver(room, {"type": "message", "item": serialize(doc)})
+
+def make_bus(backend: str = PUBSUB_BACKEND):
+    """
+    Cria o barramento configurado em PUBSUB_BACKEND ("memory" ou "mongo").
+    """
+    if backend == "memory":
+        return InProcessBus()
+    if backend == "mongo":
+        from app.database import db
+        if MESSAGE_LAYOUT == "bucket":
+            return MongoChangeStreamBus(lambda: db()["message_buckets"], bucketed=True)
+        return MongoChangeStreamBus(lambda: db()["messages"])
+    raise ValueError(f"PUBSUB_BACKEND inválido: {backend!r} (use memory ou mongo)")
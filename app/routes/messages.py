@@ -2,44 +2,73 @@
 Rotas REST para histórico e envio de mensagens.
 """
 
+import json
 from fastapi import APIRouter, Query, HTTPException, status
-from app.database import db
-from app.models import MessageIn, MessageOut, serialize
+from fastapi.responses import Response, StreamingResponse
+from app.config import EXPORT_BATCH_SIZE
+from app.models import MessageIn, MessageOut, serialize, new_message, items_json
+from app.ingest import ingest
+from app.history import history, load_page, iter_range
+from app.ws_manager import manager
 from bson import ObjectId
 from typing import Optional
-from datetime import datetime, timezone
+from datetime import datetime
 
 router = APIRouter(prefix="/rooms")
 
-@router.get("/{room}/messages", response_model=dict)
+@router.get("/{room}/messages", response_class=Response)
 async def get_messages(
     room: str, 
     limit: int = Query(20, ge=1, le=100), 
     before_id: Optional[str] = Query(None)
 ):
-    query = {"room": room}
+    before = None
     if before_id:
         try:
-            query["_id"] = {"$lt": ObjectId(before_id)}
+            before = ObjectId(before_id)
         except Exception:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="before_id inválido")
 
-    cursor = db()["messages"].find(query).sort("_id", -1).limit(limit)
-    docs = [serialize(d) async for d in cursor]
-    docs.reverse()
-    next_cursor = docs[0]["id"] if docs else None
-    return {"items": docs, "next_cursor": next_cursor}
+    if before is None:
+        items = await history.recent(room, limit, cache=manager.tracks(room))
+    else:
+        items = await load_page(room, limit, before)
+    # resposta já codificada: pula jsonable_encoder e a validação do Pydantic
+    next_cursor = json.dumps(items[0][0] if items else None)
+    body = '{"items":' + items_json(items) + ',"next_cursor":' + next_cursor + "}"
+    return Response(content=body.encode(), media_type="application/json")
+
+@router.get("/{room}/messages/export")
+async def export_messages(
+    room: str,
+    after_id: Optional[str] = Query(None),
+    since: Optional[datetime] = Query(None),
+):
+    """
+    Exporta todo o histórico da sala em NDJSON, da mensagem mais antiga
+    para a mais recente, sem carregar a sala inteira em memória.
+    """
+    id_range = {}
+    if after_id:
+        try:
+            id_range["$gt"] = ObjectId(after_id)
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="after_id inválido")
+    if since:
+        # o _id carrega o instante de criação, então o filtro usa o mesmo índice
+        id_range["$gte"] = ObjectId.from_datetime(since)
+
+    async def lines():
+        async for _, text in iter_range(room, id_range, EXPORT_BATCH_SIZE):
+            yield (text + "\n").encode()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @router.post("/{room}/messages", response_model=MessageOut, status_code=201)
 async def post_message(room: str, msg: MessageIn):
     if not msg.content.strip():
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Conteúdo não pode ser vazio")
-    doc = {
-        "room": room,
-        "username": msg.username,
-        "content": msg.content,
-        "created_at": datetime.now(timezone.utc),
-    }
-    res = await db()["messages"].insert_one(doc)
-    doc["_id"] = res.inserted_id
-    return serialize(doc)
\ No newline at end of file
+    doc = await ingest.submit(new_message(room, msg.username, msg.content))
+    item = serialize(doc)
+    await manager.publish(room, {"type": "message", "item": item})
+    return item
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""
+Rotas de observabilidade: métricas Prometheus e profiler por amostragem.
+"""
+
+from fastapi import APIRouter, Query, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from app.config import PROFILER_ENABLED
+from app.metrics import registry
+from app.profiler import profiler
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+def _check_profiler():
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Profiler desabilitado (PROFILER_ENABLED)")
+
+@router.post("/debug/profiler/start")
+async def profiler_start(interval_ms: float = Query(5.0, ge=1, le=1000)):
+    _check_profiler()
+    profiler.start(interval_ms)
+    return {"running": True, "interval_ms": interval_ms}
+
+@router.post("/debug/profiler/stop", response_class=PlainTextResponse)
+async def profiler_stop():
+    """
+    Desliga o profiler e devolve as pilhas no formato collapsed (flamegraph.pl, speedscope).
+    """
+    _check_profiler()
+    return PlainTextResponse(profiler.stop())
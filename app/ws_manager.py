@@ -2,32 +2,279 @@
 Gerencia conexões WebSocket entre salas.
 """
 
+import asyncio
+import json
+import time
 from fastapi import WebSocket
+from app.config import WS_QUEUE_SIZE, WS_SLOW_POLICY, WS_COALESCE_MAX_BYTES
+from app.pubsub import make_bus
+from app.history import history as default_history
+from app.metrics import (
+    BROADCAST_SECONDS, BROADCAST_RECIPIENTS, WS_SEND_FAILURES, WS_DISCONNECTS, WS_DROPPED,
+    ROOM_CONNECTIONS, QUEUE_DEPTH,
+)
+
+SLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+_BATCH_HEAD = '{"type":"batch","items":['
+_BATCH_TAIL = "]}"
+
+def encode(payload: dict) -> str:
+    """
+    Codifica o payload uma única vez, no mesmo formato de `send_json`.
+    """
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+def batch(frames: list) -> str:
+    """
+    Junta frames já codificados em um único frame `batch`, sem aninhar batches.
+    """
+    items = []
+    for frame in frames:
+        if frame.startswith(_BATCH_HEAD):
+            frame = frame[len(_BATCH_HEAD):-len(_BATCH_TAIL)]
+        items.append(frame)
+    return _BATCH_HEAD + ",".join(items) + _BATCH_TAIL
+
+class Connection:
+    """
+    Conexão com fila de saída limitada e uma task escritora própria,
+    para que um cliente lento não atrase os demais da sala.
+
+    Com `batch_ms > 0` o escritor espera essa janela após o primeiro frame
+    e envia tudo o que chegou nela como um único frame `batch`.
+
+    A fila guarda pares (frame, dirigido); frames dirigidos (histórico,
+    catch-up) nunca são descartados pela política de consumidor lento.
+    """
+    def __init__(self, ws: WebSocket, maxsize: int, batch_ms: int = 0,
+                 coalesce_max_bytes: int = WS_COALESCE_MAX_BYTES):
+        self.ws = ws
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.batch_ms = batch_ms
+        self.coalesce_max_bytes = coalesce_max_bytes
+        self.task = None
+        self.dropped = 0
+        self.closed = asyncio.Event()
+
+    def start(self, on_error):
+        self.task = asyncio.create_task(self._writer(on_error))
+
+    async def _writer(self, on_error):
+        while True:
+            frame, _ = await self.queue.get()
+            if self.batch_ms:
+                await asyncio.sleep(self.batch_ms / 1000)
+                if not self.queue.empty():
+                    frames = [frame]
+                    while not self.queue.empty():
+                        frames.append(self.queue.get_nowait()[0])
+                    frame = batch(frames)
+            try:
+                await self.ws.send_text(frame)
+            except Exception:
+                WS_SEND_FAILURES.inc()
+                on_error()
+                return
+
+    def stop(self):
+        self.closed.set()
+        if self.task and not self.task.done() and self.task is not asyncio.current_task():
+            self.task.cancel()
+
+    def _drain(self) -> list:
+        pending = []
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        return pending
+
+    def _coalesce(self, frame: str) -> bool:
+        """
+        Junta os frames pendentes e o novo em um único frame `batch`.
+        Retorna False se o frame agrupado passar de `coalesce_max_bytes`.
+        """
+        pending = self._drain()
+        directed = any(d for _, d in pending)
+        merged = batch([f for f, _ in pending] + [frame])
+        if len(merged) > self.coalesce_max_bytes:
+            return False
+        self.queue.put_nowait((merged, directed))
+        return True
+
+    def _drop_oldest(self, frame: str):
+        """
+        Descarta o frame de broadcast mais antigo da fila para dar lugar ao
+        novo; se só houver frames dirigidos, o novo é que fica de fora.
+        """
+        pending = self._drain()
+        for i, (_, directed) in enumerate(pending):
+            if not directed:
+                del pending[i]
+                pending.append((frame, False))
+                break
+        for item in pending:
+            self.queue.put_nowait(item)
+
+    async def put(self, frame: str) -> bool:
+        """
+        Enfileira aguardando espaço na fila (sem política de descarte).
+        Retorna False se a conexão for encerrada antes disso.
+        """
+        if self.closed.is_set():
+            return False
+        try:
+            self.queue.put_nowait((frame, True))
+            return True
+        except asyncio.QueueFull:
+            pass
+        put = asyncio.ensure_future(self.queue.put((frame, True)))
+        closed = asyncio.ensure_future(self.closed.wait())
+        done, pending = await asyncio.wait({put, closed}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        return put in done
+
+    def offer(self, frame: str, policy: str) -> bool:
+        """
+        Enfileira o frame sem bloquear. Retorna False se o cliente deve
+        ser desconectado pela política de consumidor lento.
+        """
+        try:
+            self.queue.put_nowait((frame, False))
+            return True
+        except asyncio.QueueFull:
+            pass
+        self.dropped += 1
+        WS_DROPPED.inc(policy)
+        if policy == "disconnect":
+            return False
+        if policy == "coalesce":
+            return self._coalesce(frame)
+        self._drop_oldest(frame)
+        return True
 
 class WSManager:
     """
     Gerencia as conexões WebSocket por sala.
+    Mensagens novas passam por `publish`, que as leva pelo barramento
+    pub/sub até o `broadcast` de cada processo com ouvintes na sala, e
+    também alimentam o cache de histórico recente.
     """
-    def __init__(self):
+    def __init__(self, queue_size: int = WS_QUEUE_SIZE, slow_policy: str = WS_SLOW_POLICY, bus=None,
+                 history=None):
+        if slow_policy not in SLOW_POLICIES:
+            raise ValueError(f"WS_SLOW_POLICY inválida: {slow_policy!r} (use {', '.join(SLOW_POLICIES)})")
         self.rooms = {}
+        self.queue_size = queue_size
+        self.slow_policy = slow_policy
+        self.bus = bus if bus is not None else make_bus()
+        self.history = history if history is not None else default_history
+
+    async def start(self):
+        await self.bus.start(self.broadcast)
 
-    async def connect(self, room: str, ws: WebSocket):
+    async def stop(self):
+        await self.bus.stop()
+        for room in list(self.rooms):
+            for ws in list(self.rooms.get(room, {})):
+                self.disconnect(room, ws, "shutdown")
+
+    async def connect(self, room: str, ws: WebSocket, batch_ms: int = 0):
         await ws.accept()
-        self.rooms.setdefault(room, set()).add(ws)
+        conn = Connection(ws, self.queue_size, batch_ms)
+        if room not in self.rooms:
+            self.bus.subscribe(room)
+        self.rooms.setdefault(room, {})[ws] = conn
+        conn.start(lambda: self.disconnect(room, ws, "error"))
 
-    def disconnect(self, room: str, ws: WebSocket):
+    def disconnect(self, room: str, ws: WebSocket, reason: str = "client"):
         conns = self.rooms.get(room)
         if conns and ws in conns:
-            conns.remove(ws)
+            conns.pop(ws).stop()
+            WS_DISCONNECTS.inc(reason)
             if not conns:
                 self.rooms.pop(room, None)
+                self.bus.unsubscribe(room)
+                if not self.bus.local_only:
+                    # sem ouvintes locais deixamos de ver as escritas remotas
+                    self.history.evict(room)
+
+    def tracks(self, room: str) -> bool:
+        """
+        Indica se este processo vê todas as mensagens novas da sala, ou seja,
+        se o histórico dela pode ser mantido em cache.
+        """
+        return self.bus.local_only or room in self.rooms
+
+    def collect_metrics(self):
+        ROOM_CONNECTIONS.clear()
+        QUEUE_DEPTH.clear()
+        for room, conns in self.rooms.items():
+            depths = [conn.queue.qsize() for conn in conns.values()]
+            ROOM_CONNECTIONS.set(len(depths), room)
+            QUEUE_DEPTH.set(max(depths, default=0), room, "max")
+            QUEUE_DEPTH.set(sum(depths), room, "sum")
+
+    def _kick(self, room: str, ws: WebSocket):
+        """
+        Remove um consumidor lento e fecha o socket em segundo plano.
+        """
+        self.disconnect(room, ws, "slow")
+        asyncio.create_task(self._close(ws))
+
+    @staticmethod
+    async def _close(ws: WebSocket):
+        try:
+            await ws.close(code=1013)
+        except Exception:
+            pass
+
+    async def send(self, room: str, ws: WebSocket, payload: dict):
+        """
+        Envia um payload a uma única conexão, pela mesma fila do broadcast.
+        """
+        return await self.send_frame(room, ws, encode(payload))
+
+    async def send_frame(self, room: str, ws: WebSocket, frame: str) -> bool:
+        """
+        Como `send`, para um frame já codificado em JSON. Frames dirigidos a
+        uma única conexão (histórico, catch-up) aguardam espaço na fila em vez
+        de passar pela política de consumidor lento. Retorna False se a
+        conexão não existe mais.
+        """
+        conn = self.rooms.get(room, {}).get(ws)
+        return conn is not None and await conn.put(frame)
+
+    async def publish(self, room: str, payload: dict):
+        """
+        Publica uma mensagem da sala para todos os processos inscritos nela.
+        """
+        if room not in self.rooms:
+            # sem ouvintes locais o broadcast não roda; atualiza o cache aqui
+            item = payload["item"]
+            self.history.append(room, item["id"], encode(item))
+        await self.bus.publish(room, payload)
 
     async def broadcast(self, room: str, payload: dict):
         """
-        Envia uma mensagem para todos os WebSockets conectados na sala informada.
+        Envia uma mensagem para todos os WebSockets conectados na sala informada
+        neste processo. O payload é codificado uma vez e enfileirado sem aguardar os envios.
         """
-        for ws in list(self.rooms.get(room, [])):
-            try:
-                await ws.send_json(payload)
-            except Exception:
-                self.disconnect(room, ws)
\ No newline at end of file
+        start = time.perf_counter()
+        if payload.get("type") == "message":
+            # o item é codificado uma vez e reaproveitado no cache e no frame
+            item = payload["item"]
+            text = encode(item)
+            self.history.append(room, item["id"], text)
+            frame = '{"type":"message","item":' + text + "}"
+        else:
+            frame = encode(payload)
+        conns = self.rooms.get(room)
+        if not conns:
+            return
+        for ws, conn in list(conns.items()):
+            if not conn.offer(frame, self.slow_policy):
+                self._kick(room, ws)
+        BROADCAST_RECIPIENTS.inc(amount=len(conns))
+        BROADCAST_SECONDS.observe(time.perf_counter() - start)
+
+manager = WSManager()
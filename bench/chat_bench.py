@@ -0,0 +1,253 @@
+"""
+Benchmark em processo do chat: N salas x M clientes WebSocket, mais
+escritores e leitores REST, falando ASGI direto com o app (sem rede) e
+usando o armazenamento em memória, para resultados reprodutíveis.
+
+Rode a partir da raiz do projeto:
+
+    python -m bench.chat_bench --rooms 10 --clients 50 --messages 100
+"""
+
+import os
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("PUBSUB_BACKEND", "memory")
+
+import argparse
+import asyncio
+import json
+import resource
+import statistics
+import time
+
+from app.main import app
+
+_MARK = "bench:"
+
+def rss_kb() -> int:
+    """
+    RSS atual do processo em KiB (pico, se /proc não estiver disponível).
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def _scope(kind: str, path: str, query: str = "") -> dict:
+    return {
+        "type": kind,
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "scheme": "ws" if kind == "websocket" else "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json")],
+        "server": ("bench", 80),
+        "client": ("bench", 1),
+        "subprotocols": [],
+    }
+
+async def http_request(method: str, path: str, body: bytes = b"", query: str = "") -> tuple:
+    """
+    Faz uma requisição HTTP direto no app ASGI e devolve (status, corpo).
+    """
+    scope = _scope("http", path, query)
+    scope["method"] = method
+    sent = False
+    status = None
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+class WSClient:
+    """
+    Cliente WebSocket que conversa com o app pelo protocolo ASGI.
+    """
+    def __init__(self, room: str, stats: "Stats", batch_ms: int = 0):
+        self.room = room
+        self.query = f"batch_ms={batch_ms}" if batch_ms else ""
+        self.stats = stats
+        self.inbox = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.history = asyncio.Event()
+        self.received = 0
+        self.task = None
+
+    async def connect(self):
+        await self.inbox.put({"type": "websocket.connect"})
+        self.task = asyncio.create_task(app(_scope("websocket", f"/ws/{self.room}", self.query), self.inbox.get, self._send))
+        await self.accepted.wait()
+        await self.history.wait()
+
+    async def _send(self, message):
+        if message["type"] == "websocket.accept":
+            self.accepted.set()
+        elif message["type"] == "websocket.send":
+            self._frame(json.loads(message["text"]), time.perf_counter())
+        elif message["type"] == "websocket.close":
+            self.accepted.set()
+            self.history.set()
+
+    def _frame(self, data: dict, now: float):
+        if data["type"] == "history":
+            self.history.set()
+        elif data["type"] == "batch":
+            for item in data["items"]:
+                self._frame(item, now)
+        elif data["type"] == "message":
+            content = data["item"]["content"]
+            if content.startswith(_MARK):
+                self.received += 1
+                self.stats.fanout.append(now - float(content[len(_MARK):]))
+
+    def send(self, content: str):
+        self.inbox.put_nowait({"type": "websocket.receive", "text": json.dumps({"username": "bench", "content": content})})
+
+    async def close(self):
+        await self.inbox.put({"type": "websocket.disconnect", "code": 1000})
+        await self.task
+
+class Stats:
+    def __init__(self):
+        self.fanout = []
+        self.history = []
+        self.posts = []
+        self.connect = []
+
+async def run(args) -> dict:
+    stats = Stats()
+    rooms = [f"bench-{i}" for i in range(args.rooms)]
+    rss_start = rss_kb()
+
+    async with app.router.lifespan_context(app):
+        # popula um pouco de histórico para as leituras
+        for room in rooms:
+            for i in range(args.seed):
+                await http_request("POST", f"/rooms/{room}/messages",
+                                   json.dumps({"username": "seed", "content": f"seed {i}"}).encode())
+
+        clients = {room: [WSClient(room, stats, args.batch_ms) for _ in range(args.clients)] for room in rooms}
+
+        async def connect(c):
+            t0 = time.perf_counter()
+            await c.connect()
+            stats.connect.append(time.perf_counter() - t0)
+
+        await asyncio.gather(*(connect(c) for cs in clients.values() for c in cs))
+
+        done = asyncio.Event()
+
+        async def ws_writer(room):
+            sender = clients[room][0]
+            for _ in range(args.messages):
+                sender.send(f"{_MARK}{time.perf_counter()}")
+                await asyncio.sleep(args.interval)
+
+        async def rest_writer(room):
+            for _ in range(args.posts):
+                body = json.dumps({"username": "bench", "content": f"{_MARK}{time.perf_counter()}"}).encode()
+                t0 = time.perf_counter()
+                status, _ = await http_request("POST", f"/rooms/{room}/messages", body)
+                stats.posts.append(time.perf_counter() - t0)
+                assert status == 201, status
+                await asyncio.sleep(args.interval)
+
+        async def rest_reader(n):
+            i = 0
+            while not done.is_set():
+                room = rooms[(n + i) % len(rooms)]
+                t0 = time.perf_counter()
+                status, _ = await http_request("GET", f"/rooms/{room}/messages", query="limit=20")
+                stats.history.append(time.perf_counter() - t0)
+                assert status == 200, status
+                i += 1
+                await asyncio.sleep(args.interval)
+
+        expected = args.messages + args.posts  # por cliente
+        t0 = time.perf_counter()
+        readers = [asyncio.create_task(rest_reader(n)) for n in range(args.readers)]
+        await asyncio.gather(*(ws_writer(r) for r in rooms), *(rest_writer(r) for r in rooms))
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline and any(c.received < expected for cs in clients.values() for c in cs):
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - t0
+        done.set()
+        await asyncio.gather(*readers)
+        rss_peak = rss_kb()
+
+        await asyncio.gather(*(c.close() for cs in clients.values() for c in cs))
+
+    sent = (args.messages + args.posts) * len(rooms)
+    delivered = sum(c.received for cs in clients.values() for c in cs)
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        "rooms": args.rooms,
+        "clients_per_room": args.clients,
+        "elapsed_s": round(elapsed, 3),
+        "messages_sent": sent,
+        "messages_delivered": delivered,
+        "messages_expected": sent * args.clients,
+        "sent_per_s": round(sent / elapsed, 1),
+        "delivered_per_s": round(delivered / elapsed, 1),
+        "fanout_p50_ms": ms(percentile(stats.fanout, 50)),
+        "fanout_p99_ms": ms(percentile(stats.fanout, 99)),
+        "history_requests": len(stats.history),
+        "history_p50_ms": ms(percentile(stats.history, 50)),
+        "history_p99_ms": ms(percentile(stats.history, 99)),
+        "post_p50_ms": ms(percentile(stats.posts, 50)),
+        "connect_mean_ms": ms(statistics.fmean(stats.connect)) if stats.connect else 0.0,
+        "rss_start_kb": rss_start,
+        "rss_peak_kb": rss_peak,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=20, help="clientes WebSocket por sala")
+    parser.add_argument("--messages", type=int, default=50, help="mensagens via WebSocket por sala")
+    parser.add_argument("--posts", type=int, default=10, help="mensagens via POST por sala")
+    parser.add_argument("--readers", type=int, default=4, help="leitores REST concorrentes")
+    parser.add_argument("--seed", type=int, default=20, help="mensagens pré-carregadas por sala")
+    parser.add_argument("--batch-ms", type=int, default=0, help="janela de agrupamento de frames por cliente")
+    parser.add_argument("--interval", type=float, default=0.001, help="pausa entre envios (s)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="espera máxima pelas entregas (s)")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result))
+    else:
+        width = max(len(k) for k in result)
+        for key, value in result.items():
+            print(f"{key:<{width}}  {value}")
+
+if __name__ == "__main__":
+    main()